@@ -2,14 +2,42 @@
 # This module provides a Python interface to interact with ETABS using COM.
 
 import sys
+import atexit
 import logging
+import threading
+import time
+from array import array
 import comtypes.client
+from comtypes import COMError
 from mcp.server.fastmcp import Context
 from pydantic import BaseModel
+from geometry import unique_vertices, pack_geometries
 
 logger = logging.getLogger('fea_mcp_server')
 
+# COM is initialized once per thread (and released at exit for the main thread),
+# so reconnecting does not tear down the apartment and the cached proxies
+_com_state = threading.local()
+
+def _co_initialize():
+    if getattr(_com_state, "initialized", False):
+        return
+    comtypes.CoInitialize()
+    _com_state.initialized = True
+    if threading.current_thread() is threading.main_thread():
+        atexit.register(comtypes.CoUninitialize)
+
+# ETABS preset units (eUnits enumeration, starting from 1)
+_PRESET_UNITS : tuple[str, ...] = ("lb, in, F", "lb, ft, F", "kip, in, F", "kip, ft, F", "kN, mm, C", "kN, m, C", "kgf, mm, C", "kgf, m, C", "N, mm, C", "N, m, C", "Ton, mm, C", "Ton, m, C", "kN, cm, C", "kgf, cm, C", "N, cm, C", "Ton, cm, C")
+
+# Seconds to wait after a failed connection attempt before trying again
+_RECONNECT_COOLDOWN = 5.0
+
+# Minimum number of points per object type in the batch creation
+_MIN_COORDS = {"point": 1, "line": 2, "surface": 3}
+
 # Help Classes for data definition
+# (objects read back from ETABS are built with model_construct, as the OAPI data is already typed)
 class GeomObject(BaseModel):
     """A class representing a point/line/surface to be created by points."""
     type : str
@@ -26,6 +54,14 @@ class GeomObject(BaseModel):
 class Etabs:
     def __init__(self):
         self.SapModel = None
+        self._connected = False
+        self._lastConnectFail = 0.0
+        # Creator per object type for the batch creation (specialized once, instead of per call)
+        self._batchHandlers = {
+            "point": lambda o: self.create_joint(o.xs[0], o.ys[0], o.zs[0], refresh=False),
+            "line": lambda o: self.create_frame(o.xs[0], o.ys[0], o.zs[0], o.xs[1], o.ys[1], o.zs[1], refresh=False),
+            "surface": lambda o: self.create_area(o.xs, o.ys, o.zs, refresh=False),
+        }
         self.set_modeller(False)
 
     def set_modeller(self, createModel : bool = True) -> bool:
@@ -36,22 +72,28 @@ class Etabs:
         Return Values:
         SapModel (type cOAPI pointer)
         """
-        if self.SapModel:
+        if self._connected:
             try:
                 if False and createModel: # TODO: Check if file is open
                     self.SapModel.InitializeNewModel(6) # Set units to kN, m, C
                     self.SapModel.File.NewBlank()
                 return True
             except Exception as e:
-                logger.warning(f"Invalid modeller reference ({str(e)}). Trying to reconnect.")
+                logger.warning("Invalid modeller reference (%s). Trying to reconnect.", e)
                 self.SapModel = None
+                self._connected = False
         
+        # Do not retry right after a failed attempt (creating the helper object alone is slow)
+        if time.monotonic() - self._lastConnectFail < _RECONNECT_COOLDOWN:
+            return False
+
         # Attach to a running instance of ETABS
-        comtypes.CoInitialize()
+        _co_initialize()
         try:
             # Create API helper object
             helper = comtypes.client.CreateObject('ETABSv1.Helper')
-            helper = helper.QueryInterface(comtypes.gen.ETABSv1.cHelper)
+            ETABSv1 = comtypes.gen.ETABSv1
+            helper = helper.QueryInterface(ETABSv1.cHelper)
             EtabsObject = helper.GetObject("CSI.ETABS.API.ETABSObject")
 
             if not EtabsObject:
@@ -63,18 +105,39 @@ class Etabs:
                     EtabsObject.SapModel.InitializeNewModel(6)  # Set units to kN, m, C
                     EtabsObject.SapModel.File.NewBlank()
 
-            logger.info(f"ETABS connected. OAPI Version Number: {EtabsObject.GetOAPIVersionNumber()}")
+            logger.info("ETABS connected. OAPI Version Number: %s", EtabsObject.GetOAPIVersionNumber())
+
+            # Query the typed interfaces (early binding), so calls go through the vtable instead of IDispatch,
+            # and cache the OAPI sub-objects, so each call does not resolve them again through COM
+            self.SapModel = EtabsObject.SapModel.QueryInterface(ETABSv1.cSapModel)
+            self._pointObj = self.SapModel.PointObj.QueryInterface(ETABSv1.cPointObj)
+            self._frameObj = self.SapModel.FrameObj.QueryInterface(ETABSv1.cFrameObj)
+            self._areaObj = self.SapModel.AreaObj.QueryInterface(ETABSv1.cAreaObj)
+            self._view = self.SapModel.View.QueryInterface(ETABSv1.cView)
+            self._file = self.SapModel.File.QueryInterface(ETABSv1.cFile)
 
         except Exception as e:
             logger.error("No running instance of the program found or failed to attach.")
+            self._lastConnectFail = time.monotonic()
             return False
         
-        finally:
-            comtypes.CoUninitialize()
-        
-        self.SapModel = EtabsObject.SapModel
+        self._connected = True
+        self._lastConnectFail = 0.0
         return True
 
+    def force_reconnect(self) -> str:
+        """Reconnects on ETABS (e.g. after the program was restarted)."""
+        self._connected = False
+        self._lastConnectFail = 0.0
+        if not self.set_modeller():
+            return "Error: Cannot connect on ETABS."
+        return "Connected on ETABS."
+
+    def _check_connection(self, e: Exception):
+        """Flags the connection to be re-established on the next call if a COM call failed."""
+        if isinstance(e, COMError):
+            self._connected = False
+
     def get_version(self) -> str:
         """Return model version"""
         version, myVersionNumber, ret = self.SapModel.GetVersion()
@@ -92,23 +155,22 @@ class Etabs:
         if not self.set_modeller():
             return "Error: Cannot connect on ETABS."
         
-        presetUnits = ["lb, in, F", "lb, ft, F", "kip, in, F", "kip, ft, F", "kN, mm, C", "kN, m, C", "kgf, mm, C", "kgf, m, C", "N, mm, C", "N, m, C", "Ton, mm, C", "Ton, m, C", "kN, cm, C", "kgf, cm, C", "N, cm, C", "Ton, cm, C"]
         MyUnits = self.SapModel.GetPresentUnits()
-        if MyUnits < 1 or MyUnits > len(presetUnits):
+        if MyUnits < 1 or MyUnits > len(_PRESET_UNITS):
             return "Unknown units"
-        return f"Units of force, length and temperature are set to {presetUnits[MyUnits-1]}"
+        return f"Units of force, length and temperature are set to {_PRESET_UNITS[MyUnits-1]}"
 
     def save(self):
         """Saves the current model."""
         if not self.set_modeller():
             return "Error: Cannot connect on ETABS."
         
-        ret = self.SapModel.File.Save()
+        ret = self._file.Save()
         if ret != 0:
             return "Error saving the model"
         return f"Model saved successfully."
 
-    def create_joint(self, x: float, y: float, z: float) -> str:
+    def create_joint(self, x: float, y: float, z: float, refresh: bool = True) -> str:
         """Creates a point/joint.
 
         Args:
@@ -116,17 +178,16 @@ class Etabs:
             x: X coordinate
             y: Y coordinate
             z: Z coordinate
+            refresh: Refresh the view after creating the joint
         """
-        if not self.set_modeller():
-            return "Error: Cannot connect on ETABS."
-        
-        pName, ret = self.SapModel.PointObj.AddCartesian(x, y, z)
+        pName, ret = self._pointObj.AddCartesian(x, y, z)
         if ret != 0:
             return f"Error adding joint ({x}, {y}, {z}) to the model."
-        ret = self.SapModel.View.RefreshView()
+        if refresh:
+            ret = self._view.RefreshView()
         return f"Joint created successfully with ID {pName}."
 
-    def create_frame(self, xi: float, yi: float, zi: float, xj: float, yj: float, zj: float) -> str:
+    def create_frame(self, xi: float, yi: float, zi: float, xj: float, yj: float, zj: float, refresh: bool = True) -> str:
         """Creates a line/frame.
 
         Args:
@@ -137,20 +198,19 @@ class Etabs:
             xj: End X coordinate
             yj: End Y coordinate
             zj: End Z coordinate
+            refresh: Refresh the view after creating the frame
         """
-        if not self.set_modeller():
-            return "Error: Cannot connect on ETABS."
-        
-        fName, ret = self.SapModel.FrameObj.AddByCoord(xi, yi, zi, xj, yj, zj)
+        fName, ret = self._frameObj.AddByCoord(xi, yi, zi, xj, yj, zj)
         if ret != 0:
             return f"Error adding line/frame ({xi}, {yi}, {zi}) - ({xj}, {yj}, {zj}) to the model."
         #ret = self.SapModel.FrameObj.SetLocalAxes(fName, 0)
         #if ret != 0:
         #    return f"Error adding frame rotation to the model."
-        ret = self.SapModel.View.RefreshView()
+        if refresh:
+            ret = self._view.RefreshView()
         return f"Frame created successfully with ID {fName}."
 
-    def create_area(self, x:list[float], y:list[float], z:list[float]) -> int:
+    def create_area(self, x:list[float], y:list[float], z:list[float], refresh: bool = True) -> str:
         """
         Creates a surface in ETABS modeller from the given coordinates.
 
@@ -158,20 +218,22 @@ class Etabs:
         x (list): List of x coordinates.
         y (list): List of y coordinates.
         z (list): List of z coordinates.
+        refresh (bool): Refresh the view after creating the area.
 
         Return Values:
-        int: ID of the created surface.
+        str: Success message with the ID of the created area, or an error message.
         """
-        if not self.set_modeller():
-            return "Error: Cannot connect on ETABS."
-        
-        x, y, z, aName, ret = self.SapModel.AreaObj.AddByCoord(len(x), x, y, z)
+        # Repeated outline vertices are not sent to ETABS
+        x, y, z = unique_vertices(x, y, z)
+        # Typed double arrays are marshalled to COM as a single VT_R8 SAFEARRAY copy
+        x, y, z, aName, ret = self._areaObj.AddByCoord(len(x), array('d', x), array('d', y), array('d', z))
         if ret != 0:
             return f"Error adding surface/area to the model."
-        ret = self.SapModel.View.RefreshView()
+        if refresh:
+            ret = self._view.RefreshView()
         return f"Area created successfully with ID {aName}."
 
-    def create_solid(self, x:list[float], y:list[float], z:list[float]) -> int:
+    def create_solid(self, x:list[float], y:list[float], z:list[float], refresh: bool = True) -> str:
         """
         Creates a solid in ETABS modeller from the given coordinates.
 
@@ -179,25 +241,25 @@ class Etabs:
         x (list): List of x coordinates.
         y (list): List of y coordinates.
         z (list): List of z coordinates.
+        refresh (bool): Refresh the view after creating the solid.
 
         Return Values:
-        int: ID of the created solid.
+        str: Success message with the ID of the created solid, or an error message.
         """
-        if not self.set_modeller():
-            return "Error: Cannot connect on ETABS."
-        
         # Not working
-        x, y, z, sName, ret = self.SapModel.SolidObj.AddByCoord(x, y, z)
+        x, y, z, sName, ret = self.SapModel.SolidObj.AddByCoord(array('d', x), array('d', y), array('d', z))
         if ret != 0:
             return f"Error adding volume/solid to the model."
-        ret = self.SapModel.View.RefreshView()
+        if refresh:
+            ret = self._view.RefreshView()
         return f"Solid created successfully with ID {sName}."
 
-    def create_objects_by_coordinates(self, objects: list[GeomObject], ctx: Context) -> list[str]:
+    async def create_objects_by_coordinates(self, objects: list[GeomObject], ctx: Context) -> list[str]:
         """
         Batch-creates various geometric objects in ETABS modeller. All objects can be created in one call.
         This is useful for creating multiple objects at once, such as points, lines and surfaces.
         When creating an object, there is no need to specify the lower order geometry type, as the are automatically created.
+        If the model is locked (analysed), it is unlocked first, which clears its analysis results.
 
         Parameters:
         objects (list of GeomObject): A list of object definitions.
@@ -208,146 +270,158 @@ class Etabs:
         """
         #- "spline": {"points": list[int], "closeEnds": bool}
         if not self.set_modeller():
-            return f"Error: Cannot connect on ETABS version {self.versionString}."
-        
-        results = []
+            return "Error: Cannot connect on ETABS."
+
+        handlers = self._batchHandlers
+        minCoords = _MIN_COORDS
+
+        # Validate and group the objects by type (keeping their index to return the results in order)
+        results = ["Error: Not created."] * len(objects)
+        queue = {obj_type: [] for obj_type in handlers}
+        for i, obj in enumerate(objects):
+            obj_type = obj.type.lower()
+            if obj_type not in handlers:
+                results[i] = f"Error: Unsupported type '{obj_type}'."
+            elif not (len(obj.xs) == len(obj.ys) == len(obj.zs)) or len(obj.xs) < minCoords[obj_type]:
+                results[i] = f"Error: A {obj_type} needs at least {minCoords[obj_type]} points with x, y and z coordinates."
+            else:
+                queue[obj_type].append(i)
+
+        # Create the objects type by type (the view is refreshed once at the end)
+        # The calls are issued serially on purpose: ETABS serves the OAPI from a single-threaded apartment,
+        # so fanning them out to worker threads would only add cross-apartment marshalling
+        # Report progress in ~100 steps, not on every object
+        step = max(1, len(objects) // 100)
+        done = 0
+        i = -1
         try:
-            for i in range(len(objects)):
-                # Report progress to the client
-                ctx.report_progress(i, len(objects))
-                # Create object
-                obj : GeomObject = objects[i]
+            # Unlock the model only when it is locked (unlocking clears the analysis results)
+            if self.SapModel.GetModelIsLocked():
+                self.SapModel.SetModelIsLocked(False)
+            for obj_type, indices in queue.items():
+                handler = handlers[obj_type]
+                for i in indices:
+                    if done % step == 0:
+                        await ctx.report_progress(done, len(objects))
+                    done += 1
+                    results[i] = handler(objects[i])
+        except Exception as e:
+            self._check_connection(e)
+            logger.error("Error creating object %s: %s", i, e)
+            if i >= 0:
+                results[i] = f"Error processing {objects[i].type.lower()}: {str(e)}"
+        finally:
+            # Refresh the view once at the end (skipped if the connection was lost during the batch)
+            if self._connected:
                 try:
-                    obj_type = obj.type.lower()
-                    if obj_type == "point":
-                        results.append(self.create_joint(obj.xs[0], obj.ys[0], obj.zs[0]))
-                    elif obj_type == "line":
-                        results.append(self.create_frame(obj.xs[0], obj.ys[0], obj.zs[0],
-                                                                    obj.xs[1], obj.ys[1], obj.zs[1]))
-                    elif obj_type == "surface":
-                        results.append(self.create_area(obj.xs, obj.ys, obj.zs))
-                    else:
-                        results.append(f"Error: Unsupported type '{obj_type}'.")
+                    self._view.RefreshView()
                 except Exception as e:
-                    results.append(f"Error processing {obj_type}: {str(e)}")
-        except Exception as e:
-            return f"Error creation objects: {str(e)}"
+                    self._check_connection(e)
+                    logger.error("Error refreshing the view: %s", e)
         return results
 
     # This is a bit slow
     async def get_geometries(self, ctx: Context) -> list[GeomObject] | str:
         """Gets all geometries (points, lines, surfaces or volumes) of the current model."""
         if not self.set_modeller():
-            return f"Error: Cannot connect on ETABS version {self.versionString}."
+            return "Error: Cannot connect on ETABS."
         
-        try:
-            geoms : list[GeomObject] = []
-            
-            # Get all points
-            await ctx.report_progress(0, 3)
-            [numberPts, ptNames, ptX, ptY, ptZ, ptCsys] = self.SapModel.PointObj.GetAllPoints()
-            for i in range(numberPts):
-                geoms.append(GeomObject(type="point", xs=[ptX[i]], ys=[ptY[i]], zs=[ptZ[i]], id=ptNames[i]))
-
-            # Get all lines/frames
-            await ctx.report_progress(1, 3)
-            frame_objs = self.SapModel.FrameObj.GetAllFrames()
-            for i in range(frame_objs[0]):
-                frameNm = frame_objs[1][i]
-                #prop = frame_objs[2][i]
-                #story = frame_objs[3][i]
-                #pt1 = frame_objs[4][i]
-                #pt2 = frame_objs[5][i]
-                x1 = frame_objs[6][i]
-                y1 = frame_objs[7][i]
-                z1 = frame_objs[8][i]
-                x2 = frame_objs[9][i]
-                y2 = frame_objs[10][i]
-                z2 = frame_objs[11][i]
-                geoms.append(GeomObject(type="line", xs=[x1,x2], ys=[y1,y2], zs=[z1,z2], id=frameNm))
-            
-            # Get all areas/surfaces
-            await ctx.report_progress(2, 3)
-            (n, names, design, _, delim, _, x_coords, y_coords, z_coords, _) = self.SapModel.AreaObj.GetAllAreas()
-            i = 0
-            for count, j in enumerate(delim):
-                name = names[count]
-                xs = x_coords[i: j + 1]
-                ys = y_coords[i: j + 1]
-                zs = z_coords[i: j + 1]
-                geoms.append(GeomObject(type="surface", xs=xs, ys=ys, zs=zs, id=name))
-                i = j + 1
-            
-            logger.info(f"Get geometries:")
-            logger.info(geoms)
-
-            if len(geoms) == 0:
-                return "No geometries found in the model."
-            return geoms
-        except Exception as e:
-            logger.error(f"Error getting geometries: {str(e)}")
-            return "Error: Failed getting geometries."
+        geoms : list[GeomObject] = []
+        getters = [self.get_points, self.get_frames, self.get_areas]
+        for i, getter in enumerate(getters):
+            await ctx.report_progress(i, len(getters))
+            result = getter()
+            if isinstance(result, str):
+                return "Error: Failed getting geometries."
+            geoms += result
+
+        logger.info("Got %d geometries.", len(geoms))
+
+        if len(geoms) == 0:
+            return "No geometries found in the model."
+        return geoms
         
+    async def get_geometries_binary(self, ctx: Context, fp32: bool = False) -> dict | str:
+        """
+        Gets all geometries (points, lines, surfaces) of the current model, with the coordinates packed in a compact binary form.
+        Use this instead of get_all_geometries for large models.
+
+        Parameters:
+        fp32 (bool): Pack the coordinates as 32-bit floats (about 7 significant digits) instead of 64-bit floats.
+
+        Returns:
+        dict: "types", "ids" and "counts" (number of points) of each object, "format" ("float32" or "float64"),
+            and "coords", the base64 encoded little-endian x, y, z coordinates of all the points, in object order.
+        """
+        geoms = await self.get_geometries(ctx)
+        if isinstance(geoms, str):
+            return geoms
+        return pack_geometries(geoms, fp32)
+
     def get_points(self) -> list[GeomObject] | str:
         """Gets all points of the current model."""
         if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
+            return "Error: Cannot connect on ETABS."
         
         try:
-            geoms : list[GeomObject] = []
-            [numberPts, ptNames, ptX, ptY, ptZ, ptCsys] = self.SapModel.PointObj.GetAllPoints()
-            for i in range(numberPts):
-                geoms.append(GeomObject(type="point", xs=[ptX[i]], ys=[ptY[i]], zs=[ptZ[i]], id=ptNames[i]))
+            [numberPts, ptNames, ptX, ptY, ptZ, ptCsys] = self._pointObj.GetAllPoints()
+            geoms : list[GeomObject] = [None] * numberPts
+            for i, (name, x, y, z) in enumerate(zip(ptNames[:numberPts], ptX, ptY, ptZ)):
+                geoms[i] = GeomObject.model_construct(type="point", xs=[x], ys=[y], zs=[z], id=name)
             return geoms
         except Exception as e:
-            logger.error(f"Error getting all points: {str(e)}")
+            self._check_connection(e)
+            logger.error("Error getting all points: %s", e)
             return "Error: Failed getting point."
         
+    def get_point_ids(self) -> list[str] | str:
+        """Gets the IDs (names) of all points of the current model, without their coordinates."""
+        if not self.set_modeller():
+            return "Error: Cannot connect on ETABS."
+        
+        try:
+            [numberPts, ptNames, ret] = self._pointObj.GetNameList()
+            return list(ptNames[:numberPts])
+        except Exception as e:
+            self._check_connection(e)
+            logger.error("Error getting all point IDs: %s", e)
+            return "Error: Failed getting point IDs."
+
     def get_frames(self) -> list[GeomObject] | str:
         """Gets all frames/lines of the current model."""
         if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
+            return "Error: Cannot connect on ETABS."
         
         try:
-            geoms : list[GeomObject] = []
-            frame_objs = self.SapModel.FrameObj.GetAllFrames()
-            for i in range(frame_objs[0]):
-                frameNm = frame_objs[1][i]
-                #prop = frame_objs[2][i]
-                #story = frame_objs[3][i]
-                #pt1 = frame_objs[4][i]
-                #pt2 = frame_objs[5][i]
-                x1 = frame_objs[6][i]
-                y1 = frame_objs[7][i]
-                z1 = frame_objs[8][i]
-                x2 = frame_objs[9][i]
-                y2 = frame_objs[10][i]
-                z2 = frame_objs[11][i]
-                geoms.append(GeomObject(type="line", xs=[x1,x2], ys=[y1,y2], zs=[z1,z2], id=frameNm))
+            frame_objs = self._frameObj.GetAllFrames()
+            geoms : list[GeomObject] = [None] * frame_objs[0]
+            # Walk the returned columns together (names, prop, story, pt1, pt2, x1, y1, z1, x2, y2, z2)
+            frameNms = frame_objs[1][:frame_objs[0]]
+            for i, (frameNm, x1, y1, z1, x2, y2, z2) in enumerate(zip(frameNms, *frame_objs[6:12])):
+                geoms[i] = GeomObject.model_construct(type="line", xs=[x1,x2], ys=[y1,y2], zs=[z1,z2], id=frameNm)
             return geoms
         except Exception as e:
-            logger.error(f"Error getting all frames: {str(e)}")
+            self._check_connection(e)
+            logger.error("Error getting all frames: %s", e)
             return "Error: Failed getting frames."
         
     def get_areas(self) -> list[GeomObject] | str:
         """Gets all areas/surfaces of the current model."""
         if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
+            return "Error: Cannot connect on ETABS."
         
         try:
-            geoms : list[GeomObject] = []
-            (n, names, design, _, delim, _, x_coords, y_coords, z_coords, _) = self.SapModel.AreaObj.GetAllAreas()
-            i = 0
-            for count, j in enumerate(delim):
-                name = names[count]
-                xs = x_coords[i: j + 1]
-                ys = y_coords[i: j + 1]
-                zs = z_coords[i: j + 1]
-                geoms.append(GeomObject(type="surface", xs=xs, ys=ys, zs=zs, id=name))
-                i = j + 1
+            (n, names, design, _, delim, _, x_coords, y_coords, z_coords, _) = self._areaObj.GetAllAreas()
+            geoms : list[GeomObject] = [None] * n
+            # Each delimiter is the index of the last point of an area, so the slice bounds are computed in one pass
+            stops = [j + 1 for j in delim[:n]]
+            starts = [0] + stops[:-1]
+            for k, (name, i, j) in enumerate(zip(names, starts, stops)):
+                geoms[k] = GeomObject.model_construct(type="surface", xs=list(x_coords[i:j]), ys=list(y_coords[i:j]), zs=list(z_coords[i:j]), id=name)
             return geoms
         except Exception as e:
-            logger.error(f"Error getting all areas: {str(e)}")
+            self._check_connection(e)
+            logger.error("Error getting all areas: %s", e)
             return "Error: Failed getting areas."
         
 # This is for testing purposes only
@@ -2,14 +2,83 @@
 # This module provides a Python interface to interact with the LUSAS Modeller using COM.
 
 import sys
+import inspect
 import logging
+import functools
+from typing import Literal
+from operator import methodcaller
 import win32com.client as win32client
 from mcp.server.fastmcp import Context
 from pydantic import BaseModel
+from geometry import unique_vertices, pack_geometries
 
 logger = logging.getLogger('fea_mcp_server')
 
+# Maximum dimension of the geometry created by a sweep, by higher order type
+_HOF_DIM = {"Point": 0, "Line": 1, "Surface": 2, "Volume": 3}
+
+# Rotation attribute constructor of the database, by rotation axis (any other axis rotates about z)
+_ROTATION_ATTR = {"x": "createYZRotationTransAttr", "y": "createXZRotationTransAttr", "z": "createXYRotationTransAttr"}
+
+# Sweep method, by type of the swept objects
+_SWEEPS = {"point": "sweep_points", "line": "sweep_lines", "surface": "sweep_surfaces"}
+
+def _requires_modeller(fn):
+    """
+    Decorator that checks the LUSAS connection before calling the method, returning an error message if not connected.
+    Errors escaping the method flag the connection to be checked again and are returned as an error message.
+    If the call flagged the connection and LUSAS had to be reattached (or the project recreated), the call is retried once.
+    """
+    def call(self, *args, **kwargs):
+        try:
+            return fn(self, *args, **kwargs)
+        except Exception as e:
+            self._check_connection()
+            logger.error("Error in %s: %s", fn.__name__, e)
+            return f"Error: Failed to run {fn.__name__}."
+
+    async def async_call(self, *args, **kwargs):
+        try:
+            return await fn(self, *args, **kwargs)
+        except Exception as e:
+            self._check_connection()
+            logger.error("Error in %s: %s", fn.__name__, e)
+            return f"Error: Failed to run {fn.__name__}."
+
+    def retry(self, session:int) -> bool:
+        # Retry only on a new connection: a failure on a valid one would fail again (or duplicate created objects)
+        if self._connected or not self.set_modeller():
+            return False
+        if self._session == session:
+            return False
+        logger.info("Retrying %s after reconnecting to LUSAS.", fn.__name__)
+        return True
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(self, *args, **kwargs):
+            if not self.set_modeller():
+                return f"Error: Cannot connect on LUSAS version {self.versionString}."
+            session = self._session
+            result = await async_call(self, *args, **kwargs)
+            if retry(self, session):
+                result = await async_call(self, *args, **kwargs)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if not self.set_modeller():
+            return f"Error: Cannot connect on LUSAS version {self.versionString}."
+        session = self._session
+        result = call(self, *args, **kwargs)
+        if retry(self, session):
+            result = call(self, *args, **kwargs)
+        return result
+    return wrapper
+
 # Help Classes for data definition
+# (objects read back from LUSAS are built with model_construct, as the COM data is already typed)
 class GeomObject(BaseModel):
     """A class representing a point/line/surface/volume to be created by points."""
     type : str
@@ -29,35 +98,57 @@ class Lusas:
     def __init__(self, versionString: str = "21.1"):
         self.versionString = versionString
         self.modeller : 'IFModeller' = None
+        self._connected = False
+        # Incremented whenever LUSAS is attached or a project created, so a call can tell it was reconnected
+        self._session = 0
         self.set_modeller(False)
     
     def set_modeller(self, createModel : bool = True) -> bool:
         """Checks LUSAS connection and returns True if connected."""
+        # Fast path: the connection is only probed again after a call failed (the failed call is then retried once if LUSAS was reattached)
+        if self._connected:
+            return True
+
         if self.modeller:
             try:
-                if not self.modeller.existsDatabase() and createModel:
-                    self.modeller.newProject()
+                self.check_database_Ext(createModel)
                 return True
             except Exception as e:
-                logger.warning(f"Invalid modeller reference ({str(e)}). Trying to reconnect.")
+                logger.warning("Invalid modeller reference (%s). Trying to reconnect.", e)
                 self.modeller = None
 
         # Attach to a running instance of LUSAS
         try:
             # Get the active LUSAS object
-            self.modeller: 'IFModeller' = win32client.GetActiveObject("Lusas.Modeller." + self.versionString)
+            modeller = win32client.GetActiveObject("Lusas.Modeller." + self.versionString)
+            try:
+                # Wrap it with the generated type library classes (early binding), so calls do not look up the DISPIDs by name
+                modeller = win32client.gencache.EnsureDispatch(modeller)
+            except Exception as e:
+                logger.warning("Could not generate the LUSAS type library wrapper (%s). Using late binding.", e)
+            self.modeller: 'IFModeller' = modeller
             
         except Exception as e:
-            logger.warning(f"No running instance of LUSAS version {self.versionString} found.")
+            logger.warning("No running instance of LUSAS version %s found.", self.versionString)
             return False
         
-        logger.info(f"Successfully attached on LUSAS version {self.versionString}.")
+        logger.info("Successfully attached on LUSAS version %s.", self.versionString)
+        self._session += 1
 
-        if not self.modeller.existsDatabase() and createModel:
-            self.modeller.newProject()
+        try:
+            self.check_database_Ext(createModel)
+        except Exception as e:
+            logger.warning("Could not check the LUSAS project (%s).", e)
+            self.modeller = None
+            return False
         return True
 
+    def _check_connection(self):
+        """Flags the connection to be checked again (project probe and reattach if needed) on the next call after any failed call, not only COM errors."""
+        self._connected = False
+
 # LUSAS server called commands
+    @_requires_modeller
     def get_units(self):
         """
         Gets the units of the current model.
@@ -65,15 +156,14 @@ class Lusas:
         Returns:
         str: A string describing the units of the current model.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             return f"Units of force, length, mass, time and temperature are set to {self.modeller.db().getModelUnits().getName()}"
         except Exception as e:
-            logger.error(f"Error getting the model units: {str(e)}")
+            self._check_connection()
+            logger.error("Error getting the model units: %s", e)
             return "Error: Failed to get the model units."
         
+    @_requires_modeller
     def create_point(self, x:float, y:float, z:float) -> str:
         """
         Creates a point in LUSAS modeller at the specified coordinates.
@@ -86,9 +176,6 @@ class Lusas:
         Return Values:
         int: ID of the created point.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setLowerOrderGeometryType("coordinates")
@@ -96,9 +183,11 @@ class Lusas:
             pnt: 'IFPoint' = self.modeller.db().createPoint(geom_data).getObjects("Point")[0]
             return f"Point created successfully with ID {pnt.getID()}."
         except Exception as e:
-            logger.error(f"Error creating point: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating point: %s", e)
             return "Error: Failed to create point."
 
+    @_requires_modeller
     def create_points(self, x:list[float], y:list[float], z:list[float]) -> str:
         """
         Creates points in LUSAS modeller at the specified coordinates.
@@ -111,22 +200,21 @@ class Lusas:
         Return Values:
         str: IDs of the created point.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            pntIDs = []
-            for i in range(len(x)):
-                geom_data = self.modeller.geometryData().setAllDefaults()
-                geom_data.setLowerOrderGeometryType("coordinates")
-                geom_data.addCoords(x[i], y[i], z[i])
-                pnt: 'IFPoint' = self.modeller.db().createPoint(geom_data).getObjects("Point")[0]
-                pntIDs.append(pnt.getID())
-            return f"Points created successfully with IDs {','.join(map(str, pntIDs))}."
+            db = self.modeller.db()
+            # Create all points at once (one point is created for each set of coordinates)
+            db.beginCommandBatch("MCP create points", True)
+            try:
+                pnts: list['IFPoint'] = self.points_Ext(x, y, z)
+            finally:
+                db.closeCommandBatch()
+            return f"Points created successfully with IDs {self.idList_Ext(pnts)}."
         except Exception as e:
-            logger.error(f"Error creating points: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating points: %s", e)
             return "Error: Failed to create points."
 
+    @_requires_modeller
     def create_line_by_coordinates(self, x1:float, y1:float, z1:float, x2:float, y2:float, z2:float) -> str:
         """
         Creates a line in LUSAS modeller connecting the given points.
@@ -142,9 +230,6 @@ class Lusas:
         Return Values:
         int: ID of the created line.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("straight")
@@ -154,9 +239,11 @@ class Lusas:
             ln : 'IFLine' = self.modeller.db().createLine(geom_data).getObjects("Line")[0]
             return f"Line created successfully with ID {ln.getID()}."
         except Exception as e:
-            logger.error(f"Error creating Line: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating Line: %s", e)
             return "Error: Failed to create line by coordinates."
     
+    @_requires_modeller
     def create_line_by_points(self, p1: int, p2: int) -> str:
         """
         Creates a line in LUSAS modeller connecting the given points.
@@ -168,20 +255,19 @@ class Lusas:
         Return Values:
         int: ID of the created line.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("straight")
             geom_data.setLowerOrderGeometryType("points")
-            obs = self.modeller.newObjectSet().add("point", p1).add("point", p2)
+            obs = self.objectSet_Ext("point", [p1, p2])
             ln : 'IFLine' = obs.createLine(geom_data).getObjects("Line")[0]
             return f"Line created successfully with ID {ln.getID()}."
         except Exception as e:
-            logger.error(f"Error creating Line: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating Line: %s", e)
             return "Error: Failed to create line by points."
 
+    @_requires_modeller
     def create_arc_by_points(self, p1: int, p2: int, p3: int) -> str:
         """
         Creates an arc line in LUSAS modeller connecting the given points.
@@ -194,27 +280,23 @@ class Lusas:
         Return Values:
         int: ID of the created line.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            p1 : 'IFPoint' = self.modeller.db().getObject("Point", p1)
-            p2 : 'IFPoint' = self.modeller.db().getObject("Point", p2)
-            p3 : 'IFPoint' = self.modeller.db().getObject("Point", p3)
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("arc")
             geom_data.keepMinor()
             geom_data.setStartMiddleEnd()
-            geom_data.addCoords(p1.getX(), p1.getY(), p1.getZ())
-            geom_data.addCoords(p2.getX(), p2.getY(), p2.getZ())
-            geom_data.addCoords(p3.getX(), p3.getY(), p3.getZ())
-            geom_data.setLowerOrderGeometryType("coordinates")
-            ln : 'IFLine' = self.modeller.db().createLine(geom_data).getObjects("Line")[0]
+            # Keep the given order (start, middle, end), as for the splines by points
+            geom_data.useSelectionOrder(True)
+            geom_data.setLowerOrderGeometryType("points")
+            obs = self.objectSet_Ext("point", [p1, p2, p3])
+            ln : 'IFLine' = obs.createLine(geom_data).getObjects("Line")[0]
             return f"Line created successfully with ID {ln.getID()}."
         except Exception as e:
-            logger.error(f"Error creating arc Line: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating arc Line: %s", e)
             return "Error: Failed to create arc line by points."
         
+    @_requires_modeller
     def create_arc_by_coordinates(self, x1:float, y1:float, z1:float, x2:float, y2:float, z2:float, x3:float, y3:float, z3:float) -> str:
         """
         Creates an arc line in LUSAS modeller connecting the given points.
@@ -233,9 +315,6 @@ class Lusas:
         Return Values:
         int: ID of the created line.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("arc")
@@ -248,9 +327,11 @@ class Lusas:
             ln : 'IFLine' = self.modeller.db().createLine(geom_data).getObjects("Line")[0]
             return f"Line created successfully with ID {ln.getID()}."
         except Exception as e:
-            logger.error(f"Error creating arc Line: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating arc Line: %s", e)
             return "Error: Failed to create arc line by coordinates."
 
+    @_requires_modeller
     def create_spline_by_coordinates(self, x:list[float], y:list[float], z:list[float], closeEnds:bool) -> str:
         """
         Creates a spline line in LUSAS modeller connecting the given points.
@@ -264,9 +345,6 @@ class Lusas:
         Return Values:
         int: ID of the created line.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("spline") #coons
@@ -274,14 +352,15 @@ class Lusas:
             if closeEnds:
                 geom_data.closeEndPoints(True)
             geom_data.setLowerOrderGeometryType("coordinates")
-            for i in range(len(x)):
-                geom_data.addCoords(x[i], y[i], z[i])
+            self.addCoords_Ext(geom_data, x, y, z)
             ln : 'IFLine' = self.modeller.db().createLine(geom_data).getObjects("Line")[0]
             return f"Line created successfully with ID {ln.getID()}."
         except Exception as e:
-            logger.error(f"Error creating spline: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating spline: %s", e)
             return "Error: Failed to create spline by points."
         
+    @_requires_modeller
     def create_spline_by_points(self, pnts:list[int], closeEnds:bool) -> str:
         """
         Creates a spline line in LUSAS modeller connecting the given points.
@@ -293,9 +372,6 @@ class Lusas:
         Return Values:
         int: ID of the created line.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("spline")
@@ -304,16 +380,16 @@ class Lusas:
                 geom_data.closeEndPoints(True)
             geom_data.setLowerOrderGeometryType("points")
 
-            pntsObj = self.modeller.newObjectSet()
-            for pnt in pnts:
-                pntsObj.add("point", pnt)
+            pntsObj = self.objectSet_Ext("point", pnts)
 
             ln : 'IFLine' = pntsObj.createLine(geom_data).getObjects("Line")[0]
             return f"Line created successfully with ID {ln.getID()}."
         except Exception as e:
-            logger.error(f"Error creating spline: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating spline: %s", e)
             return "Error: Failed to create spline by points."
 
+    @_requires_modeller
     def create_surface_by_coordinates(self, x:list[float], y:list[float], z:list[float]) -> str:
         """
         Creates a surface in LUSAS modeller from the given coordinates.
@@ -326,21 +402,20 @@ class Lusas:
         Return Values:
         int: ID of the created surface.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("coons")
             geom_data.setLowerOrderGeometryType("coordinates")
-            for i in range(len(x)):
-                geom_data.addCoords(x[i], y[i], z[i])
+            # Repeated outline vertices are not sent to LUSAS
+            self.addCoords_Ext(geom_data, *unique_vertices(x, y, z))
             surf : 'IFSurface' = self.modeller.db().createSurface(geom_data).getObjects("Surface")[0]
             return f"Surface created successfully with ID {surf.getID()}."
         except Exception as e:
-            logger.error(f"Error creating surface: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating surface: %s", e)
             return "Error: Failed to create surface by coordinates."
     
+    @_requires_modeller
     def create_surface_by_lines(self, lns:list[int]) -> str:
         """
         Creates a surface in LUSAS modeller from the given lines.
@@ -351,22 +426,19 @@ class Lusas:
         Return Values:
         int: ID of the created surface.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("coons")
             geom_data.setLowerOrderGeometryType("lines")
-            linesObj = self.modeller.newObjectSet()
-            for ln in lns:
-                linesObj.add("line", ln)
+            linesObj = self.objectSet_Ext("line", lns)
             surf : 'IFSurface' = linesObj.createSurface(geom_data).getObjects("Surface")[0]
             return f"Surface created successfully with ID {surf.getID()}."
         except Exception as e:
-            logger.error(f"Error creating surface: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating surface: %s", e)
             return "Error: Failed to create surface by lines."
 
+    @_requires_modeller
     def create_volume(self, surfs:list[int]) -> str:
         """
         Creates a volume in LUSAS modeller from the given surfaces.
@@ -377,22 +449,19 @@ class Lusas:
         Return Values:
         int: ID of the created volume.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geom_data = self.modeller.geometryData().setAllDefaults()
             geom_data.setCreateMethod("solidVolume")
             geom_data.setExtractAllVolumes()
-            surfsObj = self.modeller.newObjectSet()
-            for surf in surfs:
-                surfsObj.add("surface", surf)
-            vlm : 'IFVolume' = self.modeller.db().createVolume(geom_data).getObjects("Volume")[0]
+            surfsObj = self.objectSet_Ext("surface", surfs)
+            vlm : 'IFVolume' = surfsObj.createVolume(geom_data).getObjects("Volume")[0]
             return f"Volume created successfully with ID {vlm.getID()}."
         except Exception as e:
-            logger.error(f"Error creating volume: {str(e)}")
+            self._check_connection()
+            logger.error("Error creating volume: %s", e)
             return "Error: Failed to create volume by surfaces."
 
+    @_requires_modeller
     async def create_objects_by_coordinates(self, objects: list[GeomObject], ctx: Context) -> list[str]:
         """
         Batch-creates various geometric objects in LUSAS modeller. All objects can be created in one call.
@@ -407,45 +476,93 @@ class Lusas:
         list of str: Status messages for each object created.
         """
         #- "spline": {"points": list[int], "closeEnds": bool}
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
-        results = []
+        results = [""] * len(objects)
+        batchOpen = False
         try:
-            self.modeller.db().beginCommandBatch("MCP create objects", True)
+            db = self.modeller.db()
+            db.beginCommandBatch("MCP create objects", True)
+            batchOpen = True
+
+            # Create all the points with one call
+            pntIdx = [i for i, obj in enumerate(objects) if obj.type.lower() == "point"]
+            if pntIdx:
+                try:
+                    pnts : list['IFPoint'] = self.points_Ext([objects[i].xs[0] for i in pntIdx],
+                                                             [objects[i].ys[0] for i in pntIdx],
+                                                             [objects[i].zs[0] for i in pntIdx])
+                    if len(pnts) == len(pntIdx):
+                        for i, pnt in zip(pntIdx, pnts):
+                            results[i] = f"Point created successfully with ID {pnt.getID()}."
+                    else:
+                        # Coincident points were merged, so the IDs cannot be matched to the objects
+                        msg = f"Points created successfully with IDs {self.idList_Ext(pnts)}."
+                        for i in pntIdx:
+                            results[i] = msg
+                except Exception as e:
+                    self._check_connection()
+                    for i in pntIdx:
+                        results[i] = f"Error processing point: {str(e)}"
+
+            # Create the rest of the objects one by one
+            step = max(1, len(objects) // 100)
             for i in range(len(objects)):
-                # Report progress to the client
-                await ctx.report_progress(i, len(objects))
+                # Report progress to the client (in ~100 steps, not on every object)
+                if i % step == 0:
+                    await ctx.report_progress(i, len(objects))
                 # Create object
                 obj : GeomObject = objects[i]
                 try:
                     obj_type = obj.type.lower()
                     if obj_type == "point":
-                        results.append(self.create_point(obj.xs[0], obj.ys[0], obj.zs[0]))
+                        continue
                     elif obj_type == "straight line":
-                        results.append(self.create_line_by_coordinates(obj.xs[0], obj.ys[0], obj.zs[0],
-                                                                    obj.xs[1], obj.ys[1], obj.zs[1]))
+                        results[i] = self.create_line_by_coordinates(obj.xs[0], obj.ys[0], obj.zs[0],
+                                                                     obj.xs[1], obj.ys[1], obj.zs[1])
                     elif obj_type == "arc":
-                        results.append(self.create_arc_by_coordinates(obj.xs[0], obj.ys[0], obj.zs[0],
-                                                                obj.xs[1], obj.ys[1], obj.zs[1],
-                                                                obj.xs[2], obj.ys[2], obj.zs[2]))
+                        results[i] = self.create_arc_by_coordinates(obj.xs[0], obj.ys[0], obj.zs[0],
+                                                                    obj.xs[1], obj.ys[1], obj.zs[1],
+                                                                    obj.xs[2], obj.ys[2], obj.zs[2])
                     elif obj_type == "spline":
-                        results.append(self.create_spline_by_coordinates(obj.xs, obj.ys, obj.zs, False))
+                        results[i] = self.create_spline_by_coordinates(obj.xs, obj.ys, obj.zs, False)
                     elif obj_type == "surface":
-                        results.append(self.create_surface_by_coordinates(obj.xs, obj.ys, obj.zs))
+                        results[i] = self.create_surface_by_coordinates(obj.xs, obj.ys, obj.zs)
                     else:
-                        results.append(f"Error: Unsupported type '{obj_type}'.")
+                        results[i] = f"Error: Unsupported type '{obj_type}'."
                 except Exception as e:
-                    results.append(f"Error processing {obj_type}: {str(e)}")
+                    self._check_connection()
+                    results[i] = f"Error processing {obj_type}: {str(e)}"
         except Exception as e:
+            self._check_connection()
+            logger.error("Error creating objects: %s", e)
             return f"Error creation objects: {str(e)}"
         finally:
-            self.modeller.db().closeCommandBatch()
-            # Fit model in view
-            self.modeller.view().scaleToFit()
+            # Only close the batch if it was opened (fetching the database fails if LUSAS was closed)
+            if batchOpen:
+                try:
+                    db.closeCommandBatch()
+                    # Fit model in view
+                    self.modeller.view().scaleToFit()
+                except Exception as e:
+                    self._check_connection()
+                    logger.error("Error closing the command batch: %s", e)
         return results
 
 
+    def sweep(self, objectType:Literal["point", "line", "surface"], ids:list[int], vector: list[float]) -> str:
+        """
+        Sweeps the given points, lines or surfaces in the specified direction to create lines, surfaces or volumes respectively.
+
+        Parameters:
+        objectType (str): Type of the objects to sweep: "point", "line" or "surface".
+        ids (list[int]): List of IDs of the objects to sweep.
+        vector (list[float]): Direction vector for the sweep.
+
+        Return Values:
+        str: IDs of the created objects.
+        """
+        return getattr(self, _SWEEPS[objectType])(ids, vector)
+
+    @_requires_modeller
     def sweep_points(self, pnts:list[int], vector: list[float]) -> str:
         """
         Sweeps the given points in the specified direction to create lines.
@@ -457,19 +574,16 @@ class Lusas:
         Return Values:
         list[int]: List of IDs of the created lines.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            myObj = self.modeller.newObjectSet()
-            for id in pnts:
-                myObj.add("point", id)
+            myObj = self.objectSet_Ext("point", pnts)
             lines : list['IFLine'] = self.sweep_Ext(myObj, vector, "Line").getObjects("Lines")
-            return f"Points swept successfully creating lines with IDs {','.join([str(ln.getID()) for ln in lines])}."
+            return f"Points swept successfully creating lines with IDs {self.idList_Ext(lines)}."
         except Exception as e:
-            logger.error(f"Error sweeping points: {str(e)}")
+            self._check_connection()
+            logger.error("Error sweeping points: %s", e)
             return "Error: Failed to sweep points."
 
+    @_requires_modeller
     def sweep_lines(self, lines:list[int], vector: list[float]) -> str:
         """
         Sweeps the given lines in the specified direction to create surfaces.
@@ -481,19 +595,16 @@ class Lusas:
         Return Values:
         list[int]: List of IDs of the created surfaces.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            myObj = self.modeller.newObjectSet()
-            for id in lines:
-                myObj.add("point", id)
+            myObj = self.objectSet_Ext("line", lines)
             surfs : list['IFSurface'] = self.sweep_Ext(myObj, vector, "Surface").getObjects("Surfaces")
-            return f"Lines swept successfully creating surfaces with IDs {','.join([str(surf.getID()) for surf in surfs])}."
+            return f"Lines swept successfully creating surfaces with IDs {self.idList_Ext(surfs)}."
         except Exception as e:
-            logger.error(f"Error sweeping lines: {str(e)}")
+            self._check_connection()
+            logger.error("Error sweeping lines: %s", e)
             return "Error: Failed to sweep lines."
 
+    @_requires_modeller
     def sweep_surfaces(self, surfs:list[int], vector: list[float]) -> str:
         """
         Sweeps the given surfaces in the specified direction to create volumes.
@@ -505,132 +616,108 @@ class Lusas:
         Return Values:
         list[int]: List of IDs of the created volumes.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            myObj = self.modeller.newObjectSet()
-            for id in surfs:
-                myObj.add("surface", id)
+            myObj = self.objectSet_Ext("surface", surfs)
             vlms : list['IFVolume'] = self.sweep_Ext(myObj, vector, "Volume").getObjects("Volumes")
-            return f"Surfaces swept successfully creating volumes with IDs {','.join([str(vlm.getID()) for vlm in vlms])}."
+            return f"Surfaces swept successfully creating volumes with IDs {self.idList_Ext(vlms)}."
         except Exception as e:
-            logger.error(f"Error sweeping surfaces: {str(e)}")
+            self._check_connection()
+            logger.error("Error sweeping surfaces: %s", e)
             return "Error: Failed to sweep surfaces."
 
     # This is a bit slow
+    @_requires_modeller
     async def get_geometries(self, ctx: Context) -> list[GeomObject] | str:
         """Gets all geometries (points, lines, surfaces or volumes) of the current model."""
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
             geoms : list[GeomObject] = []
 
-            await ctx.report_progress(0, 4)
-            points : list['IFPoint'] = self.modeller.db().getObjects("Points")
-            for pnt in points:
-                geoms.append(GeomObject(type="point", xs=[pnt.getX()], ys=[pnt.getY()], zs=[pnt.getZ()], id=pnt.getID(), selected=pnt.isSelected()))
-
-            await ctx.report_progress(1, 4)
-            lines : list['IFLine'] = self.modeller.db().getObjects("Lines")
-            for line in lines:
-                #TODO: Check if arc
-                #if line.getTypeCode()
-                l_points : list['IFPoint'] = self.modeller.newObjectSet().add(line).addLOF("points").getObjects("Points")
-                geoms.append(GeomObject(type="line", xs=[p.getX() for p in l_points], ys=[p.getY() for p in l_points], zs=[p.getZ() for p in l_points], id=line.getID(), selected=line.isSelected()))
-                
-            await ctx.report_progress(2, 4)
-            surfaces : list['IFSurface'] = self.modeller.db().getObjects("Surfaces")
-            for surface in surfaces:
-                l_points : list['IFPoint'] = self.modeller.newObjectSet().add(surface).addLOF("points").getObjects("Points")
-                geoms.append(GeomObject(type="surface", xs=[p.getX() for p in l_points], ys=[p.getY() for p in l_points], zs=[p.getZ() for p in l_points], id=surface.getID(), selected=surface.isSelected()))
-                
-            await ctx.report_progress(3, 4)
-            volumes : list['IFVolume'] = self.modeller.db().getObjects("Volumes")
-            for volume in volumes:
-                l_points : list['IFPoint'] = self.modeller.newObjectSet().add(volume).addLOF("points").getObjects("Points")
-                geoms.append(GeomObject(type="volume", xs=[p.getX() for p in l_points], ys=[p.getY() for p in l_points], zs=[p.getZ() for p in l_points], id=volume.getID(), selected=volume.isSelected()))
+            # Point coordinates by ID, so the points shared by lines/surfaces/volumes are fetched once
+            cache : dict[int, tuple[float, float, float]] = {}
+
+            # LUSAS serves COM calls from a single-threaded apartment, so the types are collected one after the other
+            typeNames = ["Point", "Line", "Surface", "Volume"]
+            for i, typeName in enumerate(typeNames):
+                await ctx.report_progress(i, len(typeNames))
+                geoms += self.collect_Ext(typeName, cache)
                 
             if len(geoms) == 0:
                 return "No geometries found in the model."
             return geoms
         except Exception as e:
-            logger.error(f"Error getting geometries: {str(e)}")
+            self._check_connection()
+            logger.error("Error getting geometries: %s", e)
             return "Error: Failed getting geometries."
     
 
+    async def get_geometries_binary(self, ctx: Context, fp32: bool = False) -> dict | str:
+        """
+        Gets all geometries (points, lines, surfaces or volumes) of the current model, with the coordinates packed in a compact binary form.
+        Use this instead of get_all_geometries for large models.
+
+        Parameters:
+        fp32 (bool): Pack the coordinates as 32-bit floats (about 7 significant digits) instead of 64-bit floats.
+
+        Returns:
+        dict: "types", "ids" and "counts" (number of points) of each object, "format" ("float32" or "float64"),
+            and "coords", the base64 encoded little-endian x, y, z coordinates of all the points, in object order.
+        """
+        geoms = await self.get_geometries(ctx)
+        if isinstance(geoms, str):
+            return geoms
+        return pack_geometries(geoms, fp32)
+
+    @_requires_modeller
     def get_points(self) -> list[GeomObject] | str:
         """Gets all points of the current model."""
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            geoms : list[GeomObject] = []
-            points : list['IFPoint'] = self.modeller.db().getObjects("Points")
-            for pnt in points:
-                geoms.append(GeomObject(type="point", xs=[pnt.getX()], ys=[pnt.getY()], zs=[pnt.getZ()]))
-            
-            #data = [f"<Point id={pnt.getID()} x={pnt.getX()}, y={pnt.getY()}, z={pnt.getZ()}>" for pnt in pnts]
-            return geoms
+            return self.collect_Ext("Point")
         except Exception as e:
-            logger.error(f"Error getting all points: {str(e)}")
+            self._check_connection()
+            logger.error("Error getting all points: %s", e)
             return "Error: Failed getting point."
         
+    @_requires_modeller
+    def get_point_ids(self) -> list[int] | str:
+        """Gets the IDs of all points of the current model, without their coordinates."""
+        try:
+            return [pnt.getID() for pnt in self.modeller.db().getObjects("Points")]
+        except Exception as e:
+            self._check_connection()
+            logger.error("Error getting all point IDs: %s", e)
+            return "Error: Failed getting point IDs."
+        
+    @_requires_modeller
     def get_lines(self) -> list[GeomObject] | str:
         """Gets all lines of the current model."""
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            geoms : list[GeomObject] = []
-            lines : list['IFLine'] = self.modeller.db().getObjects("Lines")
-            for line in lines:
-                #TODO: Check if arc
-                #if line.getTypeCode()
-                l_points : list['IFPoint'] = self.modeller.newObjectSet().add(line).addLOF("points").getObjects("Points")
-                geoms.append(GeomObject(type="line", xs=[p.getX() for p in l_points], ys=[p.getY() for p in l_points], zs=[p.getZ() for p in l_points], id=line.getID(), selected=line.isSelected()))
-
-            #data = [f"<Line id={ln.getID()} x1={ln.getStartPoint().getX()}, y1={ln.getStartPoint().getY()}, z1={ln.getStartPoint().getZ()}, x2={ln.getEndPoint().getX()}, y2={ln.getEndPoint().getY()}, z2={ln.getEndPoint().getZ()}>" for ln in lns]
-            return geoms
+            return self.collect_Ext("Line")
         except Exception as e:
-            logger.error(f"Error getting all lines: {str(e)}")
+            self._check_connection()
+            logger.error("Error getting all lines: %s", e)
             return "Error: Failed getting lines."
         
+    @_requires_modeller
     def get_surfaces(self) -> list[GeomObject] | str:
         """Gets all surfaces of the current model."""
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            geoms : list[GeomObject] = []
-            surfaces : list['IFSurface'] = self.modeller.db().getObjects("Surfaces")
-            for surface in surfaces:
-                l_points : list['IFPoint'] = self.modeller.newObjectSet().add(surface).addLOF("points").getObjects("Points")
-                geoms.append(GeomObject(type="surface", xs=[p.getX() for p in l_points], ys=[p.getY() for p in l_points], zs=[p.getZ() for p in l_points], id=surface.getID(), selected=surface.isSelected()))
-                
-            return geoms
+            return self.collect_Ext("Surface")
         except Exception as e:
-            logger.error(f"Error getting all surfaces: {str(e)}")
+            self._check_connection()
+            logger.error("Error getting all surfaces: %s", e)
             return "Error: Failed getting surfaces."
         
+    @_requires_modeller
     def get_volumes(self) -> list[GeomObject] | str:
         """Gets all volumes of the current model."""
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            geoms : list[GeomObject] = []
-            volumes : list['IFVolume'] = self.modeller.db().getObjects("Volumes")
-            for volume in volumes:
-                l_points : list['IFPoint'] = self.modeller.newObjectSet().add(volume).addLOF("points").getObjects("Points")
-                geoms.append(GeomObject(type="volume", xs=[p.getX() for p in l_points], ys=[p.getY() for p in l_points], zs=[p.getZ() for p in l_points], id=volume.getID(), selected=volume.isSelected()))
-                
-            return geoms
+            return self.collect_Ext("Volume")
         except Exception as e:
-            logger.error(f"Error getting all volumes: {str(e)}")
+            self._check_connection()
+            logger.error("Error getting all volumes: %s", e)
             return "Error: Failed getting volumes."
         
+    @_requires_modeller
     def select(self, points : list[int], lines : list[int], surfaces : list[int], volumes : list[int]) -> str:
         """
         Selects objects in the current model.
@@ -641,71 +728,163 @@ class Lusas:
         surfaces (list[int]): List of surface IDs to select.
         volumes (list[int]): List of volume IDs to select.
         """
-        if not self.set_modeller():
-            return f"Error: Cannot connect on LUSAS version {self.versionString}."
-        
         try:
-            self.modeller.selection().remove("all")
-            for id in points:
-                self.modeller.selection().add("point", id)
-            for id in lines:
-                self.modeller.selection().add("line", id)
-            for id in surfaces:
-                self.modeller.selection().add("surface", id)
-            for id in volumes:
-                self.modeller.selection().add("volume", id)
+            # Collect the objects in a set and add them to the selection at once
+            objSet = self.objectSet_Ext("point", points)
+            self.objectSet_Ext("line", lines, objSet)
+            self.objectSet_Ext("surface", surfaces, objSet)
+            self.objectSet_Ext("volume", volumes, objSet)
+            sel = self.modeller.selection()
+            sel.remove("all")
+            sel.add(objSet)
             return "Objects selected."
         
         except Exception as e:
-            logger.error(f"Error selecting model objects: {str(e)}")
+            self._check_connection()
+            logger.error("Error selecting model objects: %s", e)
             return "Error: Failed to select objects."
 
 # LUSAS extensions (not called directly from the server)
-    def sweep_Ext(self, trgtObjSet:'IFObjectSet', vector: list[float], hofType:str):
-        types = ["Point", "Line", "Surface", "Volume"]
-        MaximumDimension = types.index(hofType)
+    def check_database_Ext(self, createModel:bool):
+        """Creates a new project if none is open (and createModel is set). The connection is flagged as valid once a project exists."""
+        if self.modeller.existsDatabase():
+            self._connected = True
+        elif createModel:
+            self.modeller.newProject()
+            self._session += 1
+            self._connected = True
+
+    def points_Ext(self, x:list[float], y:list[float], z:list[float]) -> list['IFPoint']:
+        """Creates a point for each set of coordinates, with a single geometry data and database call."""
+        geom_data = self.modeller.geometryData().setAllDefaults()
+        geom_data.setLowerOrderGeometryType("coordinates")
+        self.addCoords_Ext(geom_data, x, y, z)
+        return self.modeller.db().createPoint(geom_data).getObjects("Point")
+
+    def addCoords_Ext(self, geom_data:'IFGeometryData', x:list[float], y:list[float], z:list[float]):
+        """Adds the given coordinates to the geometry data (the addCoords method is looked up once, not per point)."""
+        addCoords = geom_data.addCoords
+        for xyz in zip(x, y, z, strict=True):
+            addCoords(*xyz)
+
+    def objectSet_Ext(self, kind:str, ids:list[int], objSet:'IFObjectSet'=None) -> 'IFObjectSet':
+        """Adds the objects of the given type and IDs to the object set (a new one if not given) and returns it."""
+        if objSet is None:
+            objSet = self.modeller.newObjectSet()
+        add = objSet.add
+        for id in ids:
+            add(kind, id)
+        return objSet
 
-        attr = self.modeller.db().createTranslationTransAttr("Temp_SweepTranslation", vector)
-        attr.setSweepType("straight")
-        attr.setHofType(hofType)
+    def collect_Ext(self, typeName:str, cache:dict[int, tuple[float, float, float]] | None = None) -> list[GeomObject]:
+        """Returns all the objects of a type ("Point", "Line", "Surface", "Volume") of the current model. Point coordinates are shared through the cache (by ID), if given."""
+        geoms : list[GeomObject] = []
+        objs = self.modeller.db().getObjects(typeName + "s")
+        if typeName == "Point":
+            for pnt in objs:
+                pid = pnt.getID()
+                x, y, z = xyz = self.xyz_Ext(pnt)
+                if cache is not None:
+                    cache[pid] = xyz
+                geoms.append(GeomObject.model_construct(type="point", xs=[x], ys=[y], zs=[z], id=pid, selected=pnt.isSelected()))
+            return geoms
 
-        geomData = self.modeller.newGeometryData()
-        geomData.setMaximumDimension(MaximumDimension)
-        geomData.setTransformation(attr)
-        geomData.sweptArcType("straight")
+        geomType = typeName.lower()
+        newObjectSet = self.modeller.newObjectSet
+        for obj in objs:
+            #TODO: Check if arc
+            #if line.getTypeCode()
+            l_points : list['IFPoint'] = newObjectSet().add(obj).addLOF("points").getObjects("Points")
+            xs, ys, zs = self.coords_Ext(l_points, cache)
+            geoms.append(GeomObject.model_construct(type=geomType, xs=xs, ys=ys, zs=zs, id=obj.getID(), selected=obj.isSelected()))
+        return geoms
+
+    def coords_Ext(self, pnts:list['IFPoint'], cache:dict[int, tuple[float, float, float]] | None = None) -> tuple[list[float], list[float], list[float]]:
+        """Returns the x, y and z coordinates of the given points, in one walk. Points found in the cache (by ID) are not fetched again; without a cache, the IDs are not read."""
+        xs, ys, zs = [], [], []
+        for p in pnts:
+            if cache is None:
+                xyz = self.xyz_Ext(p)
+            else:
+                pid = p.getID()
+                xyz = cache.get(pid)
+                if xyz is None:
+                    xyz = cache[pid] = self.xyz_Ext(p)
+            xs.append(xyz[0])
+            ys.append(xyz[1])
+            zs.append(xyz[2])
+        return xs, ys, zs
+
+    def xyz_Ext(self, pnt:'IFPoint') -> tuple[float, float, float]:
+        """Returns the x, y and z coordinates of a point."""
+        return pnt.getX(), pnt.getY(), pnt.getZ()
+
+    def idList_Ext(self, objs:list) -> str:
+        """Returns the IDs of the given objects as a comma separated string, with runs of consecutive IDs written as ranges (e.g. "1-100,105")."""
+        parts : list[str] = []
+        start = prev = None
+        for id in map(methodcaller("getID"), objs):
+            if prev is not None and id == prev + 1:
+                prev = id
+                continue
+            if start is not None:
+                parts.append(str(start) if start == prev else f"{start}-{prev}")
+            start = prev = id
+        if start is not None:
+            parts.append(str(start) if start == prev else f"{start}-{prev}")
+        return ",".join(parts)
 
-        objSet = trgtObjSet.sweep(geomData)
-        self.modeller.db().deleteAttribute(attr)
+    def sweep_Ext(self, trgtObjSet:'IFObjectSet', vector: list[float], hofType:str):
+        MaximumDimension = _HOF_DIM[hofType]
 
-        return objSet
+        db = self.modeller.db()
+        # Record the temporary attribute, the sweep and the clean up as one command
+        db.beginCommandBatch("MCP sweep", True)
+        try:
+            attr = db.createTranslationTransAttr("Temp_SweepTranslation", vector)
+            try:
+                attr.setSweepType("straight")
+                attr.setHofType(hofType)
+
+                geomData = self.modeller.newGeometryData()
+                geomData.setMaximumDimension(MaximumDimension)
+                geomData.setTransformation(attr)
+                geomData.sweptArcType("straight")
+
+                return trgtObjSet.sweep(geomData)
+            finally:
+                db.deleteAttribute(attr)
+        finally:
+            db.closeCommandBatch()
 
     def sweepRot_Ext(self, trgtObjSet:'IFObjectSet', origin:list, hofType:str, degree:float, aboutAxis:str=None):
-        types = ["Point", "Line", "Surface", "Volume"]
-        MaximumDimension = types.index(hofType)
+        MaximumDimension = _HOF_DIM[hofType]
 
         if aboutAxis is None:
             aboutAxis = "z"
 
+        db = self.modeller.db()
         title = "Temp_SweepRotation"
-        if aboutAxis.lower() == "x":
-            attr = self.modeller.db().createYZRotationTransAttr(title, degree, origin)
-        elif aboutAxis.lower() == "y":
-            attr = self.modeller.db().createXZRotationTransAttr(title, degree, origin)
-        else:
-            attr = self.modeller.db().createXYRotationTransAttr(title, degree, origin)
-
-        attr.setSweepType("minorArc")
-        attr.setHofType(hofType)
+        # Record the temporary attribute, the sweep and the clean up as one command
+        db.beginCommandBatch("MCP sweep", True)
+        try:
+            createAttr = getattr(db, _ROTATION_ATTR.get(aboutAxis.lower(), _ROTATION_ATTR["z"]))
+            attr = createAttr(title, degree, origin)
 
-        geomData = self.modeller.newGeometryData()
-        geomData.setMaximumDimension(MaximumDimension)
-        geomData.setTransformation(attr)
-        geomData.sweptArcType("minorArc")
+            try:
+                attr.setSweepType("minorArc")
+                attr.setHofType(hofType)
 
-        objSet = trgtObjSet.sweep(geomData)
-        self.modeller.db().deleteAttribute(attr)
+                geomData = self.modeller.newGeometryData()
+                geomData.setMaximumDimension(MaximumDimension)
+                geomData.setTransformation(attr)
+                geomData.sweptArcType("minorArc")
 
-        return objSet
+                return trgtObjSet.sweep(geomData)
+            finally:
+                db.deleteAttribute(attr)
+        finally:
+            db.closeCommandBatch()
 
 
 # This is for testing purposes only
@@ -22,7 +22,7 @@ class Config:
                 self.data = json.load(f)
             logger.info("Configuration loaded successfully.")
         except Exception as e:
-            logger.error(f"Could not load config file: {str(e)}")
+            logger.error("Could not load config file: %s", e)
             # Return default config if loading fails
             self.data = {
                 "server": {
@@ -35,22 +35,11 @@ class Config:
                 }
             }
 
-    @property
-    def serverName(self) -> str:
-        return self.data['server']['name']
-
-    @property
-    def serverVersion(self) -> str:
-        return self.data['server']['version']
-    
-    @property
-    def feaName(self) -> str:
-        return self.data['fea']['software'].upper()
-
-    @property
-    def feaVersion(self) -> str:
-        version = float(self.data['fea']['version'])
-        return f"{version:.1f}"
+        # Read the settings once (the config file is not reloaded while the server runs)
+        self.serverName : str = self.data['server']['name']
+        self.serverVersion : str = self.data['server']['version']
+        self.feaName : str = self.data['fea']['software'].upper()
+        self.feaVersion : str = f"{float(self.data['fea']['version']):.1f}"
 
 # This is for testing purposes only
 if __name__ == "__main__":
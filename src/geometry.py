@@ -0,0 +1,38 @@
+# FEA MCP
+# Geometry helpers shared by the software modules (ETABS, LUSAS).
+
+import sys
+import base64
+from array import array
+
+def unique_vertices(x:list[float], y:list[float], z:list[float]) -> tuple[list[float], list[float], list[float]]:
+    """Drops the repeated vertices of a surface/area outline (consecutive duplicates and a closing vertex equal to the first one)."""
+    pts = []
+    for xyz in zip(x, y, z, strict=True):
+        if not pts or xyz != pts[-1]:
+            pts.append(xyz)
+    if len(pts) > 1 and pts[0] == pts[-1]:
+        pts.pop()
+    if len(pts) == len(x):
+        return x, y, z
+    return [p[0] for p in pts], [p[1] for p in pts], [p[2] for p in pts]
+
+def pack_geometries(geoms:list, fp32:bool = False) -> dict:
+    """
+    Packs the geometries in the compact binary form returned by the get_geometries_binary tools:
+    "types", "ids" and "counts" (number of points) of each object, "format" ("float32" or "float64"),
+    and "coords", the base64 encoded little-endian x, y, z coordinates of all the points, in object order.
+    """
+    coords = array('f' if fp32 else 'd')
+    for geom in geoms:
+        for xyz in zip(geom.xs, geom.ys, geom.zs):
+            coords.extend(xyz)
+    if sys.byteorder != "little":
+        coords.byteswap()
+    return {
+        "types": [geom.type for geom in geoms],
+        "ids": [geom.id for geom in geoms],
+        "counts": [len(geom.xs) for geom in geoms],
+        "format": "float32" if fp32 else "float64",
+        "coords": base64.b64encode(coords.tobytes()).decode("ascii"),
+    }
@@ -3,10 +3,16 @@
 # This module handles the connection to the FEA software, manages the model, and provides the available interface commands.
 
 from mcp.server.fastmcp import FastMCP, Context
+import io
+import sys
+import json
+import atexit
+import queue
 import logging
-from config import *
-from Etabs import *
-from Lusas import *
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+from Etabs import Etabs
+from Lusas import Lusas
 
  # Constants
 supportedSoftware = ["LUSAS", "ETABS"]
@@ -15,14 +21,22 @@ supportedSoftware = ["LUSAS", "ETABS"]
 # Initialize FastMCP server
 mcp = FastMCP("fea", dependencies=["pywin32", "comtypes"])
 
-# Start logging
+# Start logging (the records are written by a background thread, so tool calls do not wait on the console/file)
+logQueue = queue.SimpleQueue()
+logFormatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logHandlers = [
+    logging.StreamHandler(sys.stderr),
+    logging.FileHandler('fea_mcp.log', encoding='utf-8')
+]
+for handler in logHandlers:
+    handler.setFormatter(logFormatter)
+logListener = QueueListener(logQueue, *logHandlers)
+logListener.start()
+atexit.register(logListener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('fea_mcp.log', encoding='utf-8')
-    ])
+    handlers=[QueueHandler(logQueue)],
+    force=True)
 logger = logging.getLogger('fea_mcp_server')
 logger.info("Starting FEA MCP server")
 
@@ -31,60 +45,128 @@ config = Config()
 logger.info("Set software is %s", config.feaName)
 
 
+class StdoutGuard(io.TextIOBase):
+    """Replaces sys.stdout while serving over stdio: the transport writes to the underlying buffer, any other text (e.g. a stray print) is logged and dropped so it cannot corrupt the JSON-RPC stream."""
+    def __init__(self, stdout):
+        self._stdout = stdout
+        self.buffer = stdout.buffer
+        # Text is logged line by line (a print writes its text and the newline separately)
+        self._pending = ""
+
+    @property
+    def encoding(self) -> str:
+        return self._stdout.encoding
+
+    @property
+    def errors(self) -> str:
+        return self._stdout.errors
+
+    def isatty(self) -> bool:
+        return self._stdout.isatty()
+
+    def fileno(self) -> int:
+        return self._stdout.fileno()
+
+    def write(self, s:str) -> int:
+        *lines, self._pending = (self._pending + s).split("\n")
+        for line in lines:
+            self._discard(line)
+        return len(s)
+
+    def flush(self):
+        line, self._pending = self._pending, ""
+        self._discard(line)
+
+    def _discard(self, line:str):
+        if line.strip():
+            logger.warning("Discarded stdout output: %s", line.rstrip())
+
+
+# The configuration does not change while the server runs, so it is serialized once
+configText = json.dumps(config.data, indent=4)
+
 @mcp.resource("config://app")
 def get_config() -> str:
     """Static server configuration data"""
-    return config.data
-
-# Register software specific tools (for commands available only on specific software, or not implemented yet)
+    return configText
+
+# Software specific tools (for commands available only on specific software, or not implemented yet)
+# Each entry is the tool name and the name of the software class method serving it
+_TOOLS : dict[str, list[tuple[str, str]]] = {
+    "LUSAS": [
+        ("get_units", "get_units"),
+
+        # Geometry creation tools
+        #("create_points", "create_points"),
+        #("create_line_by_points", "create_line_by_points"),
+        #("create_arc_by_points", "create_arc_by_points"),
+        #("create_arc_by_coordinates", "create_arc_by_coordinates"),
+        #("create_surface_by_lines", "create_surface_by_lines"),
+        ("create_objects_by_coordinates", "create_objects_by_coordinates"),
+
+        # Geometry operations tools
+        ("sweep", "sweep"),
+
+        # Pull Geometry tools
+        ("get_all_geometries", "get_geometries"), # a bit slow
+        ("get_geometries_binary", "get_geometries_binary"),
+        ("get_points", "get_points"),
+        ("get_point_ids", "get_point_ids"),
+        ("get_lines", "get_lines"),
+        ("get_surfaces", "get_surfaces"),
+        ("get_volumes", "get_volumes"),
+
+        ("select", "select"),
+    ],
+    "ETABS": [
+        ("get_units", "get_units"),
+        ("reconnect", "force_reconnect"),
+        #("save", "save"),
+
+        # Geometry creation tools
+        #("create_joint", "create_joint"),
+        #("create_frame", "create_frame"),
+        #("create_area", "create_area"),
+        ("create_objects_by_coordinates", "create_objects_by_coordinates"),
+
+        # Pull Geometry tools
+        ("get_all_geometries", "get_geometries"), # a bit slow
+        ("get_geometries_binary", "get_geometries_binary"),
+        ("get_points", "get_points"),
+        ("get_point_ids", "get_point_ids"),
+        ("get_frames", "get_frames"),
+        ("get_areas", "get_areas"),
+    ],
+}
+
+# Connect to the set software and register its tools
 if config.feaName == "LUSAS":
-    lusas = Lusas(config.feaVersion)
-    logger.info(f"Registering LUSAS tools...")
-
-    get_units = mcp.tool()(lusas.get_units)
-
-    # Geometry creation tools
-    #create_points = mcp.tool()(lusas.create_points)
-    #create_line_by_points = mcp.tool()(lusas.create_line_by_points)
-    #create_arc_by_points = mcp.tool()(lusas.create_arc_by_points)
-    #create_arc_by_coordinates = mcp.tool()(lusas.create_arc_by_coordinates)
-    #create_surface_by_lines = mcp.tool()(lusas.create_surface_by_lines)
-    create_objects_by_coordinates = mcp.tool()(lusas.create_objects_by_coordinates)
-
-    # Geometry operations tools
-    sweep_points = mcp.tool()(lusas.sweep_points)
-    sweep_lines = mcp.tool()(lusas.sweep_lines)
-    sweep_surfaces = mcp.tool()(lusas.sweep_surfaces)
-    
-    # Pull Geometry tools
-    get_all_geometries = mcp.tool()(lusas.get_geometries) # a bit slow
-    get_points = mcp.tool()(lusas.get_points)
-    get_lines = mcp.tool()(lusas.get_lines)
-    get_surfaces = mcp.tool()(lusas.get_surfaces)
-    get_volumes = mcp.tool()(lusas.get_volumes)
-
-    select = mcp.tool()(lusas.select)
-
+    feaSoftware = Lusas(config.feaVersion)
 elif config.feaName == "ETABS":
-    etabs = Etabs()
-    logger.info(f"Registering ETABS tools...")
-
-    get_units = mcp.tool()(etabs.get_units)
-    #save = mcp.tool()(etabs.save)
-
-    # Geometry creation tools
-    #create_joint = mcp.tool()(etabs.create_joint)
-    #create_frame = mcp.tool()(etabs.create_frame)
-    #create_area = mcp.tool()(etabs.create_area)
-    create_objects_by_coordinates = mcp.tool()(etabs.create_objects_by_coordinates)
-    
-    # Pull Geometry tools
-    get_all_geometries = mcp.tool()(etabs.get_geometries) # a bit slow
-    get_points = mcp.tool()(etabs.get_points)
-    get_frames = mcp.tool()(etabs.get_frames)
-    get_areas = mcp.tool()(etabs.get_areas)
+    feaSoftware = Etabs()
+
+if config.feaName in _TOOLS:
+    logger.info("Registering %s tools...", config.feaName)
+    for toolName, methodName in _TOOLS[config.feaName]:
+        mcp.tool(name=toolName)(getattr(feaSoftware, methodName))
+else:
+    logger.error("Software %s is not supported (supported software: %s).", config.feaName, ", ".join(supportedSoftware))
+
+def connect_in_memory():
+    """
+    Connects a client session to this server within the same process (e.g. a Python script or notebook importing this module),
+    passing the messages through memory streams instead of serializing them over stdio.
+
+    Usage:
+    async with connect_in_memory() as session:
+        await session.call_tool("get_points", {})
+    """
+    from mcp.shared.memory import create_connected_server_and_client_session
+    return create_connected_server_and_client_session(mcp._mcp_server)
 
 if __name__ == "__main__":
-    # Initialize and run the server
+    # Initialize and run the server over stdio, as launched by the AI clients (see connect_in_memory for same process Python clients)
+    # stdout is reserved for the protocol messages
+    sys.stdout = StdoutGuard(sys.stdout)
     mcp.run(transport='stdio')
     
\ No newline at end of file